@@ -1,22 +1,86 @@
 import json
 import logging
+import mmap
+import os
+import sqlite3
 from typing import Any, Dict, Optional
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module.
+    orjson = None
+
 logger = logging.getLogger("ConfigLoader")
 
 
-def deep_merge_dicts(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+def _loads(raw) -> Any:
+    """
+    Parses JSON from raw bytes (or a memoryview over them), using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()  # stdlib json cannot parse a buffer directly
+    return json.loads(raw)
+
+
+def _read_json_file(f, size: int) -> Any:
+    """
+    Parses the open binary file `f` of `size` bytes. Files of at least MMAP_MIN_BYTES are
+    memory-mapped and parsed straight from the mapping instead of being copied with read().
+    """
+    if size >= MMAP_MIN_BYTES:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # The file shrank to nothing since it was stat'ed; fall through to a plain read.
+            pass
+        else:
+            with mm, memoryview(mm) as view:
+                return _loads(view)
+    return _loads(f.read())
+
+
+def _dumps(data: Any) -> bytes:
+    """
+    Serializes `data` to indented UTF-8 JSON bytes, using orjson when available.
     """
-    Recursively merge `overrides` into `base`. For keys present in both:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
+
+# Below this size a plain read() is cheaper than setting up a memory map.
+MMAP_MIN_BYTES = 16 * 1024
+
+
+def deep_merge_dicts(base: Dict[str, Any], overrides: Dict[str, Any], *, copy: bool = True) -> Dict[str, Any]:
+    """
+    Merge `overrides` into `base`. For keys present in both:
       - If both values are dicts, merge them recursively.
       - Otherwise, the value from `overrides` takes precedence.
+
+    With copy=True (the default) `base` is left untouched: only the dicts along
+    overridden paths are copied, and untouched subtrees are shared with `base`.
+    With copy=False `base` is updated in place. If `overrides` is empty, `base`
+    itself is returned.
     """
-    merged = dict(base)
-    for key, val in overrides.items():
-        if key in merged and isinstance(merged[key], dict) and isinstance(val, dict):
-            merged[key] = deep_merge_dicts(merged[key], val)
-        else:
-            merged[key] = val
+    if not overrides:
+        return base
+    merged = dict(base) if copy else base
+    stack = [(merged, overrides)]
+    while stack:
+        target, source = stack.pop()
+        for key, val in source.items():
+            current = target.get(key)
+            if isinstance(current, dict) and isinstance(val, dict):
+                if not val:
+                    continue
+                if copy:
+                    current = dict(current)
+                    target[key] = current
+                stack.append((current, val))
+            else:
+                target[key] = val
     return merged
 
 
@@ -25,15 +89,13 @@ def ensure_overrides_table(db_conn) -> None:
     Ensures the 'config_overrides' table exists in the database.
     """
     try:
-        db_conn.execute("""
+        db_conn.executescript("""
             CREATE TABLE IF NOT EXISTS config_overrides (
                 id INTEGER PRIMARY KEY,
                 overrides TEXT
-            )
-        """)
-        db_conn.execute("""
+            );
             INSERT OR IGNORE INTO config_overrides (id, overrides)
-            VALUES (1, '{}')
+            VALUES (1, '{}');
         """)
         db_conn.commit()
     except Exception as e:
@@ -43,12 +105,19 @@ def ensure_overrides_table(db_conn) -> None:
 def load_overrides_from_db(db_conn) -> Dict[str, Any]:
     """
     Loads configuration overrides from the database.
+    The overrides table is only created (and committed) when the plain SELECT finds it
+    missing, so the common case is a single query and no state is kept per connection.
     """
+    query = "SELECT overrides FROM config_overrides WHERE id=1"
     try:
-        ensure_overrides_table(db_conn)
-        row = db_conn.execute("SELECT overrides FROM config_overrides WHERE id=1").fetchone()
+        try:
+            row = db_conn.execute(query).fetchone()
+        except sqlite3.OperationalError:
+            # No overrides table yet in this database: create it, then read again.
+            ensure_overrides_table(db_conn)
+            row = db_conn.execute(query).fetchone()
         if row and row[0]:
-            return json.loads(row[0])
+            return _loads(row[0])
         return {}
     except Exception as e:
         logger.error(f"Could not load overrides from DB: {e}")
@@ -58,10 +127,12 @@ def load_overrides_from_db(db_conn) -> Dict[str, Any]:
 def load_json_config(json_path: str) -> Dict[str, Any]:
     """
     Reads JSON from the file at `json_path` and returns it as a dictionary.
+    The file is parsed fresh on every call: callers mutate the result, and a fresh
+    parse is cheaper than deep-copying a cached one.
     """
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(json_path, 'rb') as f:
+            return _read_json_file(f, os.fstat(f.fileno()).st_size)
     except FileNotFoundError:
         logger.warning(f"JSON config file '{json_path}' not found. Returning empty dict.")
         return {}
@@ -96,8 +167,11 @@ def save_config(config: Dict[str, Any], json_path: str = "sonic_config.json") ->
     Saves the configuration dictionary to the JSON file at `json_path`.
     """
     try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
+        # Serialize before opening: opening with 'wb' truncates the file, so a
+        # serialization error must not leave an empty config behind.
+        payload = _dumps(config)
+        with open(json_path, 'wb') as f:
+            f.write(payload)
         logger.debug(f"Configuration saved to: {json_path}")
     except Exception as e:
         logger.error(f"Error saving configuration to '{json_path}': {e}")
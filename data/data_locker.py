@@ -433,6 +433,25 @@ class DataLocker:
         self.logger.debug(f"Fetched {len(portfolio_history)} portfolio snapshots.")
         return portfolio_history
 
+    def get_portfolio_history_points(self) -> List[list]:
+        """
+        Retrieves the portfolio history as chart points [ts_ms, total_value], ordered by
+        snapshot_time ascending. The ISO snapshot_time is converted to epoch milliseconds
+        inside SQLite (read as local time, like datetime.fromisoformat(...).timestamp()),
+        so no Python datetime objects are created. Unparseable timestamps are skipped.
+        """
+        self._init_sqlite_if_needed()
+        self.cursor.execute("""
+            SELECT CAST(strftime('%s', snapshot_time, 'utc') AS INTEGER) * 1000
+                   + CAST(substr(strftime('%f', snapshot_time), 4) AS INTEGER) AS ts_ms,
+                   total_value
+              FROM positions_totals_history
+             ORDER BY snapshot_time ASC
+        """)
+        points = [[row[0], row[1] or 0.0] for row in self.cursor.fetchall() if row[0] is not None]
+        self.logger.debug(f"Fetched {len(points)} portfolio history points.")
+        return points
+
     def get_latest_portfolio_snapshot(self) -> Optional[dict]:
         """
         Retrieves the most recent portfolio snapshot from the positions_totals_history table.
@@ -16,14 +16,149 @@ import math
 import datetime
 import logging
 import csv
-from utils.calc_services import CalcServices  # Import our helper
+from typing import Optional
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; run_simulation falls back to a NumPy scan.
+    njit = None
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("PositionSimulator")
+# The root logger is at DEBUG; keep Numba's compiler tracing out of it.
+logging.getLogger("numba").setLevel(logging.WARNING)
 
 MINUTES_IN_YEAR = 525600  # For a 24/7 market
 
+# Integer action codes stored per step; ACTION_NAMES maps them back to log strings.
+ACTION_NONE = 0
+ACTION_REBALANCE = 1
+ACTION_NAMES = ("NONE", "REBALANCE")
+
+# Column order of export_log_to_csv; the hedge fields are zero on non-rebalance steps.
+CSV_FIELDS = ("step", "timestamp", "price", "travel_percent", "static_travel_percent", "action",
+              "unrealized_pnl", "cumulative_profit", "trade_profit", "hedging_cost", "net_profit")
+
+# Steps evaluated per vectorized pass when scanning for the next rebalance without Numba.
+REBALANCE_SCAN_WINDOW = 512
+
+
+def _simulate_path_vec(entry_price: float, mu_dt: float, sig_sqrt_dt: float, eps: np.ndarray,
+                       out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Generate an entire geometric Brownian motion price path in one shot, one step per
+    pre-drawn standard normal in `eps`.
+
+    :param mu_dt: Per-step log drift, (drift - 0.5 * volatility**2) * dt.
+    :param sig_sqrt_dt: Per-step log volatility, volatility * sqrt(dt).
+    :param out: Optional float64 array to build the path in (may be `eps` itself);
+        every step runs in place, so no temporaries are allocated.
+    """
+    out = np.multiply(eps, sig_sqrt_dt, out=out)
+    out += mu_dt
+    np.cumsum(out, out=out)
+    np.exp(out, out=out)
+    out *= entry_price
+    return out
+
+
+def _static_travel_percent_vec(prices: np.ndarray, entry_price: float, liquidation_price: float,
+                               is_long: bool) -> np.ndarray:
+    """
+    Vectorized CalcServices.calculate_travel_percent_no_profit over a whole price path.
+    """
+    if entry_price <= 0 or liquidation_price <= 0 or entry_price == liquidation_price:
+        return np.zeros_like(prices)
+    scale = 100.0 / abs(entry_price - liquidation_price)
+    if is_long:
+        return (prices - entry_price) * scale
+    return (entry_price - prices) * scale
+
+
+def _rebalance_loop_kernel(prices, entry_price, liquidation_price, position_size, rebalance_threshold,
+                           hedging_cost_pct, is_long, cumulative_profit, total_hedging_cost, rebalance_count,
+                           travel_out, actions_out, trade_profit_out, hedging_cost_out, unrealized_out,
+                           cumulative_out):
+    """
+    Sequential travel-percent check and rebalance bookkeeping over a precomputed price path.
+    Mirrors PositionSimulator._calculate_travel_percent / _execute_rebalance with scalar ops only,
+    so Numba can compile it to a tight native loop. Per-step values are written into the
+    preallocated *_out columns; the final counters are returned.
+    """
+    side_sign = 1.0 if is_long else -1.0
+    effective_entry = entry_price
+    # 100 / (distance from entry to liquidation), refreshed only when the entry resets.
+    denominator = side_sign * (effective_entry - liquidation_price)
+    inv_denom = 0.0 if denominator == 0 else 100.0 / denominator
+    for i in range(prices.shape[0]):
+        price = prices[i]
+        move = side_sign * (price - effective_entry)
+        tp = move * inv_denom
+        travel_out[i] = tp
+        if tp <= rebalance_threshold:
+            profit = move * position_size
+            cost = abs(price * position_size) * hedging_cost_pct
+            cumulative_profit += profit - cost
+            total_hedging_cost += cost
+            rebalance_count += 1
+            effective_entry = price
+            denominator = side_sign * (effective_entry - liquidation_price)
+            inv_denom = 0.0 if denominator == 0 else 100.0 / denominator
+            actions_out[i] = ACTION_REBALANCE
+            trade_profit_out[i] = profit
+            hedging_cost_out[i] = cost
+        unrealized_out[i] = side_sign * (price - effective_entry) * position_size
+        cumulative_out[i] = cumulative_profit
+    return effective_entry, cumulative_profit, total_hedging_cost, rebalance_count
+
+
+# Explicit signature: Numba compiles the kernel eagerly at import (and caches the machine
+# code on disk) instead of paying the JIT cost inside the first request.
+_REBALANCE_LOOP_SIGNATURE = (
+    "Tuple((float64, float64, float64, int64))("
+    "float64[::1], float64, float64, float64, float64, float64, boolean, float64, float64, int64, "
+    "float64[::1], int8[::1], float64[::1], float64[::1], float64[::1], float64[::1])"
+)
+
+if njit is not None:
+    _run_rebalance_loop = njit(_REBALANCE_LOOP_SIGNATURE, cache=True, fastmath=True, nogil=True)(_rebalance_loop_kernel)
+else:
+    _run_rebalance_loop = None
+
+
+def columns_to_log(columns: dict, start_time: datetime.datetime) -> list:
+    """
+    Materialize a PositionSimulator.columns mapping into the classic one-dict-per-step log.
+    Timestamps are formatted here, from `start_time` plus each step's minute offset.
+    """
+    log = []
+    for step, offset, price, travel, static_travel, code, unrealized, cumulative, profit, cost in zip(
+            columns["step"].tolist(), columns["ts_offset_min"].tolist(), columns["price"].tolist(),
+            columns["travel_percent"].tolist(), columns["static_travel_percent"].tolist(),
+            columns["action"].tolist(), columns["unrealized_pnl"].tolist(),
+            columns["cumulative_profit"].tolist(), columns["trade_profit"].tolist(),
+            columns["hedging_cost"].tolist()):
+        step_log = {
+            "step": step,
+            "timestamp": (start_time + datetime.timedelta(minutes=offset)).isoformat(),
+            "price": price,
+            "travel_percent": travel,
+            "static_travel_percent": static_travel,
+            "action": ACTION_NAMES[code],
+            "unrealized_pnl": unrealized,
+            "cumulative_profit": cumulative
+        }
+        if code == ACTION_REBALANCE:
+            step_log.update({
+                "trade_profit": profit,
+                "hedging_cost": cost,
+                "net_profit": profit - cost
+            })
+        log.append(step_log)
+    return log
+
+
 class PositionSimulator:
     def __init__(self,
                  entry_price: float,
@@ -55,25 +190,71 @@ class PositionSimulator:
         self.original_entry_price = entry_price  # For static travel percent calculation
 
         self.effective_entry_price = entry_price  # This resets with each hedge.
+        self._update_inv_denom()
         self.cumulative_profit = 0.0
         self.total_hedging_cost = 0.0
         self.rebalance_count = 0
-        self.simulation_log = []
+        self.start_time = datetime.datetime.now()
+        self._alloc_columns(0)
+
+    def _alloc_columns(self, n: int):
+        """
+        Preallocate the struct-of-arrays step log for `n` steps.
+        """
+        self._col_step = np.arange(1, n + 1)
+        self._col_ts_offset = np.empty(n, dtype=np.float64)
+        self._col_price = np.empty(n, dtype=np.float64)
+        self._col_travel = np.empty(n, dtype=np.float64)
+        self._col_static_travel = np.empty(n, dtype=np.float64)
+        self._col_action = np.zeros(n, dtype=np.int8)
+        self._col_unrealized = np.empty(n, dtype=np.float64)
+        self._col_cum_profit = np.empty(n, dtype=np.float64)
+        self._col_trade_profit = np.zeros(n, dtype=np.float64)
+        self._col_hedging_cost = np.zeros(n, dtype=np.float64)
+
+    @property
+    def columns(self) -> dict:
+        """
+        The step log of the last run as parallel NumPy arrays keyed by log field name.
+        "action" holds integer codes (see ACTION_NAMES) and "ts_offset_min" the step's
+        offset in minutes from start_time, in place of a formatted timestamp.
+        """
+        return {
+            "step": self._col_step,
+            "ts_offset_min": self._col_ts_offset,
+            "price": self._col_price,
+            "travel_percent": self._col_travel,
+            "static_travel_percent": self._col_static_travel,
+            "action": self._col_action,
+            "unrealized_pnl": self._col_unrealized,
+            "cumulative_profit": self._col_cum_profit,
+            "trade_profit": self._col_trade_profit,
+            "hedging_cost": self._col_hedging_cost
+        }
+
+    @property
+    def simulation_log(self) -> list:
+        """
+        The step log materialized as one dict per step. Built on access from the columns,
+        so prefer `columns` on hot paths.
+        """
+        return columns_to_log(self.columns, self.start_time)
 
     def generate_simulated_position(sim_results):
-        # Use the final simulation log entry as a summary of the simulated position.
-        if sim_results.get("simulation_log"):
-            final_step = sim_results["simulation_log"][-1]
+        # Use the final simulated step as a summary of the simulated position.
+        columns = sim_results.get("columns")
+        if columns is not None and columns["step"].size:
+            final_price = float(columns["price"][-1])
             simulated_position = {
                 "asset_type": "BTC",  # You can adjust this based on your input
                 "position_type": "Long" if sim_results["position_side"] == "long" else "Short",
-                "pnl_after_fees_usd": final_step.get("cumulative_profit", 0.0),
+                "pnl_after_fees_usd": float(columns["cumulative_profit"][-1]),
                 "collateral": sim_results.get("collateral", 1000.0),
-                "value": final_step.get("price", 0.0) * sim_results.get("position_size", 1.0),
+                "value": final_price * sim_results.get("position_size", 1.0),
                 "size": sim_results.get("position_size", 1.0),
-                "leverage": (final_step.get("price", 0.0) * sim_results.get("position_size", 1.0)) / sim_results.get(
+                "leverage": (final_price * sim_results.get("position_size", 1.0)) / sim_results.get(
                     "collateral", 1000.0),
-                "current_travel_percent": final_step.get("travel_percent", 0.0),
+                "current_travel_percent": float(columns["travel_percent"][-1]),
                 "heat_index": 0.0,  # Insert computation if needed
                 "liquidation_distance": sim_results.get("liquidation_price", 8000),
                 "wallet_image": "default_wallet.png"
@@ -81,28 +262,24 @@ class PositionSimulator:
             return simulated_position
         return {}
 
-    def _simulate_price_path(self, current_price: float, drift: float, volatility: float, dt: float) -> float:
+    def _update_inv_denom(self):
         """
-        Generate the next price using geometric Brownian motion.
+        Cache 100 / (distance from the effective entry price to liquidation) so travel
+        percent is a single multiply; 0.0 when entry and liquidation coincide.
         """
-        epsilon = np.random.normal()
-        factor = (drift - 0.5 * volatility ** 2) * dt + volatility * np.sqrt(dt) * epsilon
-        return current_price * math.exp(factor)
+        if self.position_side == "long":
+            denominator = self.effective_entry_price - self.liquidation_price
+        else:
+            denominator = self.liquidation_price - self.effective_entry_price
+        self._inv_denom = 100.0 / denominator if denominator != 0 else 0.0
 
     def _calculate_travel_percent(self, current_price: float) -> float:
         """
         Calculate dynamic travel percent relative to the effective entry price.
         """
         if self.position_side == "long":
-            denominator = self.effective_entry_price - self.liquidation_price
-            if denominator == 0:
-                return 0.0
-            return ((current_price - self.effective_entry_price) / denominator) * 100
-        else:
-            denominator = self.liquidation_price - self.effective_entry_price
-            if denominator == 0:
-                return 0.0
-            return ((self.effective_entry_price - current_price) / denominator) * 100
+            return (current_price - self.effective_entry_price) * self._inv_denom
+        return (self.effective_entry_price - current_price) * self._inv_denom
 
     def _execute_rebalance(self, current_price: float):
         """
@@ -114,66 +291,133 @@ class PositionSimulator:
             trade_profit = (self.effective_entry_price - current_price) * self.position_size
         hedging_cost = abs(current_price * self.position_size) * self.hedging_cost_pct
         net_profit = trade_profit - hedging_cost
-        logger.debug(
-            f"Rebalancing at {current_price:.2f}: profit {trade_profit:.2f}, cost {hedging_cost:.2f}, net {net_profit:.2f}")
+        logger.debug("Rebalancing at %.2f: profit %.2f, cost %.2f, net %.2f",
+                     current_price, trade_profit, hedging_cost, net_profit)
         self.cumulative_profit += net_profit
         self.total_hedging_cost += hedging_cost
         self.rebalance_count += 1
         self.effective_entry_price = current_price
+        self._update_inv_denom()
         return {
             "trade_profit": trade_profit,
             "hedging_cost": hedging_cost,
             "net_profit": net_profit
         }
 
+    def _rebalance_scan_vec(self, prices: np.ndarray):
+        """
+        NumPy rebalance detector, used when Numba is not installed. Travel percent is
+        evaluated for a whole window of steps against the current effective entry price and
+        the first step at or below the threshold is located with one vectorized compare;
+        only the rebalance itself runs in Python. Fills the same columns as _run_rebalance_loop.
+        """
+        n = prices.shape[0]
+        is_long = self.position_side == "long"
+        idx = 0
+        while idx < n:
+            segment = prices[idx:idx + REBALANCE_SCAN_WINDOW]
+            entry = self.effective_entry_price
+            moves = segment - entry if is_long else entry - segment
+            travel = moves * self._inv_denom
+            hits = np.flatnonzero(travel <= self.rebalance_threshold)
+            end = int(hits[0]) + 1 if hits.size else segment.shape[0]
+            stop = idx + end
+            self._col_travel[idx:stop] = travel[:end]
+            self._col_unrealized[idx:stop] = moves[:end] * self.position_size
+            self._col_cum_profit[idx:stop] = self.cumulative_profit
+            if hits.size:
+                hit = stop - 1
+                hedge_details = self._execute_rebalance(float(prices[hit]))
+                self._col_action[hit] = ACTION_REBALANCE
+                self._col_trade_profit[hit] = hedge_details["trade_profit"]
+                self._col_hedging_cost[hit] = hedge_details["hedging_cost"]
+                # The position was just reset to this price.
+                self._col_unrealized[hit] = 0.0
+                self._col_cum_profit[hit] = self.cumulative_profit
+            idx = stop
+
     def run_simulation(self,
                        simulation_duration: float = 60,  # in minutes
                        dt_minutes: float = 1,            # time step in minutes
                        drift: float = 0.05,
-                       volatility: float = 0.8):
+                       volatility: float = 0.8,
+                       rng: Optional[np.random.Generator] = None):
         """
         Run the simulation over a specified duration.
+
+        The per-step log is returned as parallel NumPy arrays under "columns" (see the
+        `columns` property); use `simulation_log` if one dict per step is really needed.
+
+        :param rng: Optional NumPy Generator; pass a seeded one for reproducible paths.
         """
         dt = dt_minutes / MINUTES_IN_YEAR  # Convert minutes to fraction of a year
-        num_steps = int(simulation_duration / dt_minutes)
+        num_steps = max(0, int(simulation_duration / dt_minutes))  # a negative duration is an empty run
         current_price = self.entry_price
-        calc = CalcServices()  # to compute static travel percent
+        # GBM step constants are loop invariants; compute them once with scalar math.
+        mu_dt = (drift - 0.5 * volatility * volatility) * dt
+        sig_sqrt_dt = volatility * math.sqrt(dt)
+        if rng is None:
+            rng = np.random.default_rng()
+        self._alloc_columns(num_steps)
+        # Draw every step's shock in a single RNG call, straight into the price column.
+        prices = rng.standard_normal(num_steps, out=self._col_price)
+        # The whole price path is independent of rebalancing, so generate it up front, in place.
+        _simulate_path_vec(self.entry_price, mu_dt, sig_sqrt_dt, prices, out=prices)
         logger.info(f"Running simulation for {num_steps} steps over {simulation_duration} minutes")
 
-        for step in range(num_steps):
-            sim_time = datetime.datetime.now() + datetime.timedelta(minutes=step * dt_minutes)
-            next_price = self._simulate_price_path(current_price, drift, volatility, dt)
-            dynamic_travel_pct = self._calculate_travel_percent(next_price)
-            # Compute static travel percent using the original entry price
-            static_travel_pct = calc.calculate_travel_percent_no_profit(self.position_side.upper(),
-                                                                        self.original_entry_price,
-                                                                        next_price,
-                                                                        self.liquidation_price)
-            action = "NONE"
-            hedge_details = None
-            if dynamic_travel_pct <= self.rebalance_threshold:
-                action = "REBALANCE"
-                hedge_details = self._execute_rebalance(next_price)
-            if self.position_side == "long":
-                unrealized_pnl = (next_price - self.effective_entry_price) * self.position_size
-            else:
-                unrealized_pnl = (self.effective_entry_price - next_price) * self.position_size
-            step_log = {
-                "step": step + 1,
-                "timestamp": sim_time.isoformat(),
-                "price": next_price,
-                "travel_percent": dynamic_travel_pct,
-                "static_travel_percent": static_travel_pct,
-                "action": action,
-                "unrealized_pnl": unrealized_pnl,
-                "cumulative_profit": self.cumulative_profit
-            }
-            if hedge_details:
-                step_log.update(hedge_details)
-            self.simulation_log.append(step_log)
-            logger.debug(
-                f"Step {step + 1}: Price={next_price:.2f}, Dynamic Travel%={dynamic_travel_pct:.2f}, Static Travel%={static_travel_pct:.2f}, Action={action}, Unrealized PnL={unrealized_pnl:.2f}, Cumulative Profit={self.cumulative_profit:.2f}")
-            current_price = next_price
+        is_long = self.position_side == "long"
+        # Until the first rebalance every step is measured against the starting entry price.
+        # If no step on the path reaches the threshold from there, nothing ever rebalances and
+        # all columns follow in closed form from the price path; skip the sequential detector.
+        moves = prices - self.effective_entry_price if is_long else self.effective_entry_price - prices
+        travel = moves * self._inv_denom
+        if not num_steps or travel.min() > self.rebalance_threshold:
+            self._col_travel[:] = travel
+            np.multiply(moves, self.position_size, out=self._col_unrealized)
+            self._col_cum_profit.fill(self.cumulative_profit)
+        elif _run_rebalance_loop is not None:
+            (self.effective_entry_price, self.cumulative_profit, self.total_hedging_cost,
+             self.rebalance_count) = _run_rebalance_loop(prices,
+                                                         float(self.effective_entry_price),
+                                                         float(self.liquidation_price),
+                                                         float(self.position_size),
+                                                         float(self.rebalance_threshold),
+                                                         float(self.hedging_cost_pct),
+                                                         is_long,
+                                                         float(self.cumulative_profit),
+                                                         float(self.total_hedging_cost),
+                                                         int(self.rebalance_count),
+                                                         self._col_travel,
+                                                         self._col_action,
+                                                         self._col_trade_profit,
+                                                         self._col_hedging_cost,
+                                                         self._col_unrealized,
+                                                         self._col_cum_profit)
+        else:
+            self._rebalance_scan_vec(prices)
+        # Static travel percent is measured against the original entry price
+        self._col_static_travel[:] = _static_travel_percent_vec(prices, self.original_entry_price,
+                                                                self.liquidation_price, is_long)
+
+        # Step timestamps are kept as minute offsets from a single start time and only
+        # formatted when the log is materialized.
+        self.start_time = datetime.datetime.now()
+        np.multiply(np.arange(num_steps), dt_minutes, out=self._col_ts_offset)
+
+        # Per-step debug output is only assembled when DEBUG logging is actually enabled.
+        if logger.isEnabledFor(logging.DEBUG):
+            for step, (next_price, travel, static_travel, code, unrealized, cumulative, profit, cost) in enumerate(
+                    zip(prices.tolist(), self._col_travel.tolist(), self._col_static_travel.tolist(),
+                        self._col_action.tolist(), self._col_unrealized.tolist(), self._col_cum_profit.tolist(),
+                        self._col_trade_profit.tolist(), self._col_hedging_cost.tolist())):
+                if _run_rebalance_loop is not None and code == ACTION_REBALANCE:
+                    logger.debug("Rebalancing at %.2f: profit %.2f, cost %.2f, net %.2f",
+                                 next_price, profit, cost, profit - cost)
+                logger.debug("Step %d: Price=%.2f, Dynamic Travel%%=%.2f, Static Travel%%=%.2f, Action=%s, "
+                             "Unrealized PnL=%.2f, Cumulative Profit=%.2f",
+                             step + 1, next_price, travel, static_travel, ACTION_NAMES[code], unrealized, cumulative)
+        if num_steps:
+            current_price = float(prices[-1])
 
         if self.position_side == "long":
             final_unrealized = (current_price - self.effective_entry_price) * self.position_size
@@ -184,7 +428,7 @@ class PositionSimulator:
         logger.info(
             f"Simulation complete: Final Price {current_price:.2f}, Rebalances {self.rebalance_count}, Total Profit {total_profit:.2f}")
         return {
-            "simulation_log": self.simulation_log,
+            "columns": self.columns,
             "final_price": current_price,
             "final_unrealized_pnl": final_unrealized,
             "cumulative_profit": self.cumulative_profit,
@@ -198,14 +442,26 @@ class PositionSimulator:
         }
 
     def export_log_to_csv(self, filename: str):
-        if not self.simulation_log:
+        if not self._col_step.size:
             logger.warning("No simulation log data to export.")
             return
-        keys = self.simulation_log[0].keys()
+        timestamps = [(self.start_time + datetime.timedelta(minutes=offset)).isoformat()
+                      for offset in self._col_ts_offset.tolist()]
+        actions = [ACTION_NAMES[code] for code in self._col_action.tolist()]
         with open(filename, 'w', newline='') as csvfile:
-            dict_writer = csv.DictWriter(csvfile, fieldnames=keys)
-            dict_writer.writeheader()
-            dict_writer.writerows(self.simulation_log)
+            writer = csv.writer(csvfile)
+            writer.writerow(CSV_FIELDS)
+            writer.writerows(zip(self._col_step.tolist(),
+                                 timestamps,
+                                 self._col_price.tolist(),
+                                 self._col_travel.tolist(),
+                                 self._col_static_travel.tolist(),
+                                 actions,
+                                 self._col_unrealized.tolist(),
+                                 self._col_cum_profit.tolist(),
+                                 self._col_trade_profit.tolist(),
+                                 self._col_hedging_cost.tolist(),
+                                 (self._col_trade_profit - self._col_hedging_cost).tolist()))
         logger.info(f"Simulation log exported to {filename}")
 
 
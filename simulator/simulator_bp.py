@@ -9,37 +9,237 @@ time step, drift, volatility, position side, etc.) via interactive controls and
 charts comparing simulated results with historical data pulled from the database via DataLocker.
 """
 
-from flask import Blueprint, render_template, request, current_app, url_for, jsonify
+from flask import Blueprint, render_template, request, current_app, url_for, jsonify, make_response
+import functools
 import logging
+import time
+import zlib
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to jsonify with .tolist().
+    orjson = None
+
 from simulator.simulation import PositionSimulator
 from data.data_locker import DataLocker
 
 simulator_bp = Blueprint('simulator', __name__, template_folder='templates')
 logger = logging.getLogger("SimulatorBP")
 
+# Simulation parameters and the converter applied to each incoming raw value.
+# The order here is also the order of the parameters inside the cache key tuple.
+_SIM_PARAM_SPECS = (
+    ("entry_price", float),
+    ("liquidation_price", float),
+    ("position_size", float),
+    ("collateral", float),
+    ("rebalance_threshold", float),
+    ("hedging_cost_pct", float),
+    ("simulation_duration", float),
+    ("dt_minutes", float),
+    ("drift", float),
+    ("volatility", float),
+    ("position_side", str.lower)
+)
+SIM_PARAM_NAMES = tuple(name for name, _ in _SIM_PARAM_SPECS)
+
+# Default simulation parameters, shared by every view; callers copy before overriding.
+DEFAULT_SIM_PARAMS = {
+    "entry_price": 10000.0,
+    "liquidation_price": 8000.0,
+    "position_size": 1.0,
+    "collateral": 1000.0,
+    "rebalance_threshold": -25.0,
+    "hedging_cost_pct": 0.001,
+    "simulation_duration": 60.0,  # minutes
+    "dt_minutes": 1.0,
+    "drift": 0.05,
+    "volatility": 0.8,
+    "position_side": "long"
+}
+
+# Step columns sent to the charts by /simulation/data, as parallel arrays.
+CHART_COLUMNS = ("step", "cumulative_profit", "travel_percent", "price", "unrealized_pnl")
+
+# Simulation side of a /compare page: the baseline and tweaked SimRuns and the simulated
+# position summary built from the baseline run.
+CompareSims = namedtuple("CompareSims", ["baseline_run", "tweaked_run", "simulated_positions"])
+
+# Result of one cached simulation run: read-only step columns, the summary dict
+# returned by run_simulation (minus the per-step log), the final effective entry price
+# and the start time the step timestamps are offset from.
+SimRun = namedtuple("SimRun", ["columns", "summary", "effective_entry_price", "start_time"])
+
+# Runs longer than this are not memoized. The caches are bounded by entry count, not size,
+# and step columns take roughly 75 bytes per step (~0.37 MB per run at this limit), so a full
+# _run_sim_cached (256 runs) stays near 95 MB. _compare_sims shares those SimRun objects; only
+# runs the run cache has since evicted are extra, at most 2 x 128, for ~190 MB combined.
+MAX_CACHED_SIM_STEPS = 5000
+
+# Historical positions/portfolio chart shared by /compare hits within the TTL.
+HIST_CACHE_TTL_SECONDS = 10
+_HIST_CACHE = {"ts": 0.0, "data": None}
+
+# Cache-Control for responses. Default-param GETs are deterministic, so browsers may reuse
+# them; /compare also shows live DB positions, so it only lives as long as the historical cache.
+DASHBOARD_CACHE_CONTROL = "public, max-age=300"
+COMPARE_CACHE_CONTROL = f"private, max-age={HIST_CACHE_TTL_SECONDS}"
+NO_STORE_CACHE_CONTROL = "no-store"
+
+
+@functools.lru_cache(maxsize=256)
+def _run_sim_cached(params_tuple, seed):
+    """
+    Runs one simulation for a frozen parameter tuple and seed. Seeding the RNG makes the
+    run deterministic, which is what makes memoizing it correct.
+    """
+    params = dict(zip(SIM_PARAM_NAMES, params_tuple))
+    simulator = PositionSimulator(
+        entry_price=params["entry_price"],
+        liquidation_price=params["liquidation_price"],
+        position_size=params["position_size"],
+        collateral=params["collateral"],
+        rebalance_threshold=params["rebalance_threshold"],
+        hedging_cost_pct=params["hedging_cost_pct"],
+        position_side=params["position_side"]
+    )
+    summary = simulator.run_simulation(
+        simulation_duration=params["simulation_duration"],
+        dt_minutes=params["dt_minutes"],
+        drift=params["drift"],
+        volatility=params["volatility"],
+        rng=np.random.default_rng(seed)
+    )
+    columns = summary.pop("columns")
+    for column in columns.values():
+        column.flags.writeable = False  # shared between cache hits
+    return SimRun(columns, summary, simulator.effective_entry_price, simulator.start_time)
+
+
+def _load_historical_data():
+    """
+    Returns (positions, portfolio chart points) from the database via DataLocker.
+    The result is reused for HIST_CACHE_TTL_SECONDS so repeated /compare hits skip
+    both queries.
+    """
+    now = time.monotonic()
+    if _HIST_CACHE["data"] is not None and now - _HIST_CACHE["ts"] < HIST_CACHE_TTL_SECONDS:
+        return _HIST_CACHE["data"]
+
+    data_locker = DataLocker.get_instance()
+    historical_positions = data_locker.get_positions()
+
+    historical_chart = data_locker.get_portfolio_history_points()
+
+    _HIST_CACHE["ts"] = now
+    _HIST_CACHE["data"] = (historical_positions, historical_chart)
+    return _HIST_CACHE["data"]
+
+
+def _parse_sim_params(source, defaults):
+    """
+    Builds a simulation parameter dict from `source` (request JSON or form data), one
+    field at a time: missing or unparseable fields keep their value from `defaults`.
+    """
+    if hasattr(source, "to_dict"):
+        source = source.to_dict()  # read a form MultiDict once into a plain dict
+    params = dict(defaults)
+    for name, convert in _SIM_PARAM_SPECS:
+        raw = source.get(name)
+        if raw is None:
+            continue
+        try:
+            params[name] = convert(raw)
+        except (TypeError, ValueError) as e:
+            logger.warning("Ignoring invalid simulation parameter %s=%r: %s", name, raw, e)
+    return params
+
+
+def _json_sim_params():
+    """
+    Parses simulation parameters from the request's JSON body over DEFAULT_SIM_PARAMS.
+    Returns None if the body is not a JSON object.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, Mapping):
+        return None
+    return _parse_sim_params(data, DEFAULT_SIM_PARAMS)
+
+
+def _bad_params_response():
+    """
+    400 response for a JSON body that is not an object.
+    """
+    return _with_cache_control(
+        (jsonify(error="Simulation parameters must be a JSON object"), 400), NO_STORE_CACHE_CONTROL
+    )
+
+
+def _with_cache_control(body, cache_control):
+    """
+    Wraps a view's return value in a response carrying the given Cache-Control header.
+    """
+    response = make_response(body)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def _params_seed(params_tuple):
+    """
+    Stable RNG seed for a parameter tuple. Unlike hash(), which is salted per process for
+    strings, this is the same across restarts, so identical inputs replay the same path.
+    """
+    return zlib.crc32(repr(params_tuple).encode())
+
+
+def _is_cacheable_run(params):
+    """
+    True if a run for `params` is small enough (at most MAX_CACHED_SIM_STEPS steps) to memoize.
+    """
+    dt_minutes = params["dt_minutes"]
+    return not dt_minutes or params["simulation_duration"] / dt_minutes <= MAX_CACHED_SIM_STEPS
+
+
+def run_simulation_cached(params, seed=None):
+    """
+    Returns the (memoized) SimRun for a parameter dict. Without an explicit seed, one is
+    derived from the parameters so identical inputs reuse the same run. Runs of more than
+    MAX_CACHED_SIM_STEPS steps are computed fresh instead of being kept in the cache.
+    """
+    params_tuple = tuple(params[name] for name in SIM_PARAM_NAMES)
+    if seed is None:
+        seed = _params_seed(params_tuple)
+    if not _is_cacheable_run(params):
+        return _run_sim_cached.__wrapped__(params_tuple, seed)
+    return _run_sim_cached(params_tuple, seed)
+
 def generate_simulated_position(sim_results):
     """
-    Generates a simulated position summary from the simulation log.
+    Generates a simulated position summary from the simulation's step columns.
     This summary uses the final step to compute a dollar value ("size") of the holding.
     """
-    if sim_results.get("simulation_log"):
-        final_step = sim_results["simulation_log"][-1]
+    columns = sim_results.get("columns")
+    if columns is not None and columns["step"].size:
         # Compute the dollar value of the holding.
         # Here, position_size is assumed to be the number of units,
         # so value = price * units.
-        value = final_step.get("price", 0.0) * sim_results.get("position_size", 1.0)
+        value = float(columns["price"][-1]) * sim_results.get("position_size", 1.0)
         # Leverage is computed as value divided by collateral.
         leverage = value / sim_results.get("collateral", 1000.0)
         simulated_position = {
             "asset_type": "BTC",  # Adjust as needed or derive from input.
             "position_type": "Long" if sim_results["position_side"] == "long" else "Short",
-            "pnl_after_fees_usd": final_step.get("cumulative_profit", 0.0),
+            "pnl_after_fees_usd": float(columns["cumulative_profit"][-1]),
             "collateral": sim_results.get("collateral", 1000.0),
             "value": value,
             "size": value,  # Now 'size' represents the dollar value of the holding.
             "leverage": leverage,
-            "current_travel_percent": final_step.get("travel_percent", 0.0),
+            "current_travel_percent": float(columns["travel_percent"][-1]),
             "heat_index": 0.0,  # Insert logic to compute heat index if needed.
             "liquidation_distance": sim_results.get("liquidation_price", 8000.0),
             "wallet_image": "default_wallet.png"
@@ -56,87 +256,45 @@ def simulator_dashboard():
     On POST: Expects JSON simulation parameters, runs the simulation, and returns results as JSON.
     """
     if request.method == "POST":
-        try:
-            data = request.get_json() or {}
-            entry_price = float(data.get("entry_price", 10000))
-            liquidation_price = float(data.get("liquidation_price", 8000))
-            position_size = float(data.get("position_size", 1.0))
-            collateral = float(data.get("collateral", 1000.0))
-            rebalance_threshold = float(data.get("rebalance_threshold", -25))
-            hedging_cost_pct = float(data.get("hedging_cost_pct", 0.001))
-            simulation_duration = float(data.get("simulation_duration", 60))
-            dt_minutes = float(data.get("dt_minutes", 1))
-            drift = float(data.get("drift", 0.05))
-            volatility = float(data.get("volatility", 0.8))
-            position_side = data.get("position_side", "long").lower()
-        except Exception as e:
-            logger.error("Error parsing simulation parameters: %s", e)
-            return jsonify(error=str(e)), 400
-
-        simulator = PositionSimulator(
-            entry_price=entry_price,
-            liquidation_price=liquidation_price,
-            position_size=position_size,
-            collateral=collateral,
-            rebalance_threshold=rebalance_threshold,
-            hedging_cost_pct=hedging_cost_pct,
-            position_side=position_side
-        )
-        results = simulator.run_simulation(
-            simulation_duration=simulation_duration,
-            dt_minutes=dt_minutes,
-            drift=drift,
-            volatility=volatility
-        )
+        params = _json_sim_params()
+        if params is None:
+            return _bad_params_response()
+        sim_run = run_simulation_cached(params)
+        results = dict(sim_run.summary)
         # Compute leverage as (effective_entry_price * position_size) / collateral.
-        leverage = (simulator.effective_entry_price * position_size) / collateral
-
-        # Prepare chart data from the simulation log.
-        chart_data = []
-        for log_entry in results["simulation_log"]:
-            chart_data.append({
-                "step": log_entry["step"],
-                "cumulative_profit": log_entry["cumulative_profit"],
-                "travel_percent": log_entry["travel_percent"],
-                "price": log_entry["price"],
-                "unrealized_pnl": log_entry["unrealized_pnl"]
-            })
+        leverage = (sim_run.effective_entry_price * params["position_size"]) / params["collateral"]
 
         response_data = {
-            "params": {
-                "entry_price": entry_price,
-                "liquidation_price": liquidation_price,
-                "position_size": position_size,
-                "collateral": collateral,
-                "rebalance_threshold": rebalance_threshold,
-                "hedging_cost_pct": hedging_cost_pct,
-                "simulation_duration": simulation_duration,
-                "dt_minutes": dt_minutes,
-                "drift": drift,
-                "volatility": volatility,
-                "position_side": position_side
-            },
+            "params": params,
             "results": results,
-            "chart_data": chart_data,
             "leverage": leverage
         }
-        return jsonify(response_data)
+        return _with_cache_control(jsonify(response_data), NO_STORE_CACHE_CONTROL)
     else:
         # For GET, render a basic dashboard page (could be used for testing).
-        params = {
-            "entry_price": 10000,
-            "liquidation_price": 8000,
-            "position_size": 1.0,
-            "collateral": 1000.0,
-            "rebalance_threshold": -25.0,
-            "hedging_cost_pct": 0.001,
-            "simulation_duration": 60,
-            "dt_minutes": 1,
-            "drift": 0.05,
-            "volatility": 0.8,
-            "position_side": "long"
-        }
-        return render_template("simulator_dashboard.html", params=params)
+        return _with_cache_control(render_template("simulator_dashboard.html", params=DEFAULT_SIM_PARAMS),
+                                   DASHBOARD_CACHE_CONTROL)
+
+@simulator_bp.route('/simulation/data', methods=['POST'])
+def simulation_chart_data():
+    """
+    Chart data endpoint used by the dashboard and compare pages.
+    Expects the same JSON parameters as /simulation and returns the chart columns as
+    parallel arrays (one list per series, zipped together by the frontend).
+    """
+    params = _json_sim_params()
+    if params is None:
+        return _bad_params_response()
+    columns = run_simulation_cached(params).columns
+    if orjson is not None:
+        # orjson serializes the NumPy columns directly, without building Python lists.
+        body = current_app.response_class(
+            orjson.dumps({name: columns[name] for name in CHART_COLUMNS}, option=orjson.OPT_SERIALIZE_NUMPY),
+            mimetype="application/json"
+        )
+    else:
+        body = jsonify({name: columns[name].tolist() for name in CHART_COLUMNS})
+    return _with_cache_control(body, NO_STORE_CACHE_CONTROL)
 
 @simulator_bp.route('/load_current_positions', methods=['GET'])
 def load_current_positions():
@@ -156,111 +314,76 @@ def compare_simulation():
     then connects to DataLocker to retrieve historical positions and portfolio snapshots.
     The final data is passed to compare.html for a side-by-side comparison.
     """
-    # Default baseline simulation parameters.
-    baseline_params = {
-        "entry_price": 10000.0,
-        "liquidation_price": 8000.0,
-        "position_size": 1.0,
-        "collateral": 1000.0,
-        "rebalance_threshold": -25.0,
-        "hedging_cost_pct": 0.001,
-        "simulation_duration": 60,  # minutes
-        "dt_minutes": 1,
-        "drift": 0.05,
-        "volatility": 0.8,
-        "position_side": "long"
-    }
-
-    # Override defaults with POSTed form data, if available.
+    # Default baseline simulation parameters, overridden with POSTed form data if available.
+    baseline_params = DEFAULT_SIM_PARAMS
     if request.method == "POST":
-        try:
-            baseline_params["entry_price"] = float(request.form.get("entry_price", baseline_params["entry_price"]))
-            baseline_params["liquidation_price"] = float(request.form.get("liquidation_price", baseline_params["liquidation_price"]))
-            baseline_params["position_size"] = float(request.form.get("position_size", baseline_params["position_size"]))
-            baseline_params["collateral"] = float(request.form.get("collateral", baseline_params["collateral"]))
-            baseline_params["rebalance_threshold"] = float(request.form.get("rebalance_threshold", baseline_params["rebalance_threshold"]))
-            baseline_params["hedging_cost_pct"] = float(request.form.get("hedging_cost_pct", baseline_params["hedging_cost_pct"]))
-            baseline_params["simulation_duration"] = float(request.form.get("simulation_duration", baseline_params["simulation_duration"]))
-            baseline_params["dt_minutes"] = float(request.form.get("dt_minutes", baseline_params["dt_minutes"]))
-            baseline_params["drift"] = float(request.form.get("drift", baseline_params["drift"]))
-            baseline_params["volatility"] = float(request.form.get("volatility", baseline_params["volatility"]))
-            baseline_params["position_side"] = request.form.get("position_side", baseline_params["position_side"]).lower()
-        except Exception as e:
-            logger.error("Error parsing simulation parameters: %s", e)
+        baseline_params = _parse_sim_params(request.form, baseline_params)
 
-    # Create tweaked parameters (e.g., increase collateral by 10%).
-    tweaked_params = baseline_params.copy()
-    tweaked_params["collateral"] = baseline_params["collateral"] * 1.10
-
-    # Run baseline simulation.
-    baseline_simulator = PositionSimulator(
-        entry_price=baseline_params["entry_price"],
-        liquidation_price=baseline_params["liquidation_price"],
-        position_size=baseline_params["position_size"],
-        collateral=baseline_params["collateral"],
-        rebalance_threshold=baseline_params["rebalance_threshold"],
-        hedging_cost_pct=baseline_params["hedging_cost_pct"],
-        position_side=baseline_params["position_side"]
-    )
-    baseline_results = baseline_simulator.run_simulation(
-        simulation_duration=baseline_params["simulation_duration"],
-        dt_minutes=baseline_params["dt_minutes"],
-        drift=baseline_params["drift"],
-        volatility=baseline_params["volatility"]
-    )
+    params_tuple = tuple(baseline_params[name] for name in SIM_PARAM_NAMES)
+    seed = _params_seed(params_tuple)
+    if _is_cacheable_run(baseline_params):
+        sims = _compare_sims(params_tuple, seed)
+    else:
+        sims = _compare_sims.__wrapped__(params_tuple, seed)
 
-    # Run tweaked simulation.
-    tweaked_simulator = PositionSimulator(
-        entry_price=tweaked_params["entry_price"],
-        liquidation_price=tweaked_params["liquidation_price"],
-        position_size=tweaked_params["position_size"],
-        collateral=tweaked_params["collateral"],
-        rebalance_threshold=tweaked_params["rebalance_threshold"],
-        hedging_cost_pct=tweaked_params["hedging_cost_pct"],
-        position_side=tweaked_params["position_side"]
-    )
-    tweaked_results = tweaked_simulator.run_simulation(
-        simulation_duration=tweaked_params["simulation_duration"],
-        dt_minutes=tweaked_params["dt_minutes"],
-        drift=tweaked_params["drift"],
-        volatility=tweaked_params["volatility"]
-    )
+    # Historical positions and portfolio snapshots (cached for a few seconds). The page is
+    # rendered per request from exactly the data loaded here.
+    historical_positions, historical_chart = _load_historical_data()
 
     # Prepare simulation chart data (using step vs cumulative_profit).
-    baseline_chart = [[entry["step"], entry["cumulative_profit"]] for entry in baseline_results["simulation_log"]]
-    tweaked_chart = [[entry["step"], entry["cumulative_profit"]] for entry in tweaked_results["simulation_log"]]
+    baseline_chart = _profit_chart(sims.baseline_run.columns)
+    tweaked_chart = _profit_chart(sims.tweaked_run.columns)
     chart_data = {
         "simulated": baseline_chart,
-        "real": tweaked_chart  # Placeholder; will be overridden if historical data is available.
+        # The tweaked run is a placeholder for when no historical data is available.
+        "real": historical_chart if historical_chart else tweaked_chart
     }
 
-    # Connect to the database to retrieve historical positions and portfolio snapshots.
-    data_locker = DataLocker.get_instance()
-    historical_positions = data_locker.get_positions()
-
-    portfolio_history = data_locker.get_portfolio_history()
-    historical_chart = []
-    for entry in portfolio_history:
-        try:
-            dt_obj = datetime.fromisoformat(entry["snapshot_time"])
-            timestamp = int(dt_obj.timestamp() * 1000)
-            historical_chart.append([timestamp, entry.get("total_value", 0.0)])
-        except Exception as e:
-            logger.error("Error processing portfolio snapshot: %s", e)
-    if historical_chart:
-        chart_data["real"] = historical_chart
-
-    # Generate simulated position summary from baseline simulation.
-    simulated_position = generate_simulated_position(baseline_results)
-    simulated_positions = [simulated_position]
-
-    return render_template(
+    html = render_template(
         "compare.html",
         chart_data=chart_data,
         baseline_compare=baseline_chart,
         tweaked_compare=tweaked_chart,
-        simulated_positions=simulated_positions,
+        simulated_positions=sims.simulated_positions,
         real_positions=historical_positions,
         timeframe=24,  # Example timeframe; adjust as needed.
         now=datetime.now()
     )
+    cache_control = NO_STORE_CACHE_CONTROL if request.method == "POST" else COMPARE_CACHE_CONTROL
+    return _with_cache_control(html, cache_control)
+
+
+@functools.lru_cache(maxsize=128)
+def _compare_sims(params_tuple, seed):
+    """
+    Runs the baseline and tweaked simulations for /compare and builds the simulated position
+    summary. Memoized per (params, seed), so repeat hits with identical inputs skip the
+    simulations; the charts and the page itself are built per request.
+    """
+    baseline_params = dict(zip(SIM_PARAM_NAMES, params_tuple))
+
+    # Create tweaked parameters (e.g., increase collateral by 10%).
+    tweaked_params = baseline_params.copy()
+    tweaked_params["collateral"] = baseline_params["collateral"] * 1.10
+
+    # Run (or reuse) the baseline and tweaked simulations concurrently. The rebalance kernel
+    # is compiled with nogil, so the runs overlap for real. The pool is per call so one long
+    # run only ever holds its own request's threads.
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="simulator") as executor:
+        baseline_future = executor.submit(run_simulation_cached, baseline_params, seed)
+        tweaked_future = executor.submit(run_simulation_cached, tweaked_params)
+        baseline_run, tweaked_run = baseline_future.result(), tweaked_future.result()
+    baseline_results = dict(baseline_run.summary, columns=baseline_run.columns)
+
+    # Generate simulated position summary from baseline simulation.
+    simulated_position = generate_simulated_position(baseline_results)
+    simulated_positions = [simulated_position]
+
+    return CompareSims(baseline_run, tweaked_run, simulated_positions)
+
+
+def _profit_chart(columns):
+    """
+    (step, cumulative_profit) pairs for a run's step columns.
+    """
+    return list(zip(columns["step"].tolist(), columns["cumulative_profit"].tolist()))
@@ -1,4 +1,5 @@
-from PIL import Image, ImageEnhance, ImageOps
+from PIL import Image, ImageOps
+import numpy as np
 import sys
 
 def make_nightscape(input_path, output_path):
@@ -8,26 +9,29 @@ def make_nightscape(input_path, output_path):
     # 2) Darken the image - but not too much
     #    Increase darken_factor for a darker scene, decrease for brighter.
     darken_factor = 0.6  # Instead of 0.3
-    enhancer = ImageEnhance.Brightness(img)
-    img_dark = enhancer.enhance(darken_factor)
 
     # 3) Add a bluish/purple tint
-    r, g, b = img_dark.split()
-    r = r.point(lambda i: i * 0.8)
-    g = g.point(lambda i: i * 0.9)
-    b = b.point(lambda i: i * 1.2)
-    img_tinted = Image.merge("RGB", (r, g, b))
+    #    Darken and tint are both per-channel scales, so apply them together
+    #    as one multiply over the pixel array instead of split/point/merge.
+    tint = np.array([0.8, 0.9, 1.2], dtype=np.float32) * darken_factor
+    arr = np.asarray(img, dtype=np.float32) * tint
+    np.clip(arr, 0, 255, out=arr)
+    np.floor(arr, out=arr)  # same values as the uint8 tinted image
+    img_tinted = Image.fromarray(arr.astype(np.uint8), "RGB")
 
     # 4) Convert tinted to grayscale, then threshold for a silhouette
     gray = img_tinted.convert("L")
     threshold = 130
-    silhouette = gray.point(lambda x: 0 if x < threshold else 255, 'L')
-    silhouette_rgb = silhouette.convert("RGB")
+    sky = np.asarray(gray) >= threshold
 
     # 5) Blend tinted with silhouette
     #    Lower alpha => more of tinted sky is visible (less silhouette).
+    #    The silhouette is pure black/white, so the blend is a scale of the tinted
+    #    pixels plus a constant on the sky mask; no silhouette image is built.
     blend_alpha = 0.5  # Instead of 0.8
-    img_night = Image.blend(img_tinted, silhouette_rgb, alpha=blend_alpha)
+    arr *= 1 - blend_alpha
+    arr[sky] += 255 * blend_alpha
+    img_night = Image.fromarray(arr.astype(np.uint8), "RGB")
 
     # 6) Save the final result
     img_night.save(output_path)